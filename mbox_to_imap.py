@@ -1,16 +1,30 @@
 #!/usr/bin/env python3
 
-import mailbox
+import argparse
+import array
+import collections
+import concurrent.futures
+import datetime
+import functools
 import imaplib
+import io
+import mmap
 import email
 import email.utils
-import email.message # For type hinting
+import email.parser
+import email.policy
+import re
 import time
 import os
 import getpass
+import hashlib
+import json
+import queue
 import socket
 import sys
+import threading
 import traceback # For detailed error reporting
+import zlib
 
 # --- Configuration (Review these defaults) ---
 
@@ -25,14 +39,86 @@ DEFAULT_USE_SSL = True   # Set to False for non-SSL (port 143 usually)
 # Default target mailbox/folder on the IMAP server
 DEFAULT_TARGET_MAILBOX = "Imported_Mbox"
 
-# Delay between uploading messages in seconds (to avoid rate limiting)
-UPLOAD_DELAY_SECONDS = 0.1
+# Upload rate limiting (messages per second, shared by all connections). The rate starts at
+# DEFAULT_INITIAL_RATE, is halved whenever the server signals throttling, and grows by 10%
+# after every RATE_INCREASE_INTERVAL successful uploads, up to DEFAULT_MAX_RATE.
+DEFAULT_INITIAL_RATE = 50.0
+DEFAULT_MAX_RATE = 500.0
+DEFAULT_BURST = 50
+RATE_INCREASE_INTERVAL = 100
+
+# Messages sent per pipelined batch (only used when the server supports LITERAL+)
+APPEND_BATCH_SIZE = 32
+
+# A batch is also closed once its messages add up to this many bytes, so batches
+# of large messages hold fewer of them
+APPEND_BATCH_BYTES = 4 * 1024 * 1024
+
+# Messages each connection may have sent without an answer yet (override with --inflight).
+# Covering two batches means the next batch is on the wire while the last one is answered.
+DEFAULT_INFLIGHT = 2 * APPEND_BATCH_SIZE
 
 # How often to print progress updates (e.g., every 50 messages)
 PROGRESS_INTERVAL = 50
 
+# Upload errors are listed in the summary; only the most recent ones are kept
+MAX_REPORTED_ERRORS = 20
+
+# Number of parallel IMAP connections used for uploading (override with --workers)
+DEFAULT_WORKERS = 4
+
+# Upper limit for --workers; most providers allow only a handful of connections per account
+MAX_WORKERS = 15
+
+# How many times a batch is retried when the server signals throttling
+MAX_RETRIES = 5
+
+# First retry delay in seconds; doubled after every further failed attempt
+RETRY_BASE_DELAY_SECONDS = 1.0
+
+# Uploaded messages are recorded in "<mbox file>.progress.jsonl" so an interrupted run
+# can resume; the record is forced to disk after this many messages
+RESUME_FSYNC_INTERVAL = 500
+
+# Message-IDs of the messages already in the target folder are fetched this many at a time
+DEDUPE_FETCH_BATCH = 5000
+
+# zlib level for COMPRESS=DEFLATE connections (1 = fastest; most of the gain on text mail)
+COMPRESS_LEVEL = 1
+
 # --- End Configuration ---
 
+def parse_args():
+    """Parses the optional command-line tuning flags."""
+    parser = argparse.ArgumentParser(description="Upload the messages of an MBOX file to an IMAP folder.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"parallel IMAP connections to upload with (1-{MAX_WORKERS}, default {DEFAULT_WORKERS})")
+    parser.add_argument("--initial-rate", type=float, default=DEFAULT_INITIAL_RATE,
+                        help=f"starting upload rate in messages per second (default {DEFAULT_INITIAL_RATE:g})")
+    parser.add_argument("--max-rate", type=float, default=DEFAULT_MAX_RATE,
+                        help=f"upper limit for the upload rate in messages per second (default {DEFAULT_MAX_RATE:g})")
+    parser.add_argument("--burst", type=int, default=DEFAULT_BURST,
+                        help=f"messages that may be sent at once before the rate applies (default {DEFAULT_BURST})")
+    parser.add_argument("--inflight", type=int, default=DEFAULT_INFLIGHT,
+                        help=f"messages per connection that may await the server's answer on servers "
+                             f"supporting LITERAL+ (default {DEFAULT_INFLIGHT})")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore the progress file of a previous run and upload every message again")
+    parser.add_argument("--in-order", action="store_true",
+                        help="upload messages in MBOX file order instead of largest first")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="upload messages even if the target folder already has a message with the same Message-ID")
+    args = parser.parse_args()
+    if not 1 <= args.workers <= MAX_WORKERS:
+        parser.error(f"--workers must be between 1 and {MAX_WORKERS}")
+    if args.initial_rate <= 0 or args.max_rate < args.initial_rate:
+        parser.error("--initial-rate must be positive and not larger than --max-rate")
+    if args.burst < 1:
+        parser.error("--burst must be at least 1")
+    if args.inflight < 1:
+        parser.error("--inflight must be at least 1")
+    return args
+
 def get_imap_details():
     """Gets IMAP connection details from the user."""
     print("--- IMAP Server Configuration ---")
@@ -61,24 +147,897 @@ def get_imap_details():
 
     return host, port, use_ssl, user, password, target_mailbox
 
-def get_message_date(msg: email.message.Message) -> tuple | None:
-    """Attempts to get the internal date from the message header."""
-    date_str = msg.get('Date')
+# Fast path for the common RFC 2822 Date shape, e.g. "Mon, 1 Mar 2021 10:00:00 +0200"
+_DATE_RE = re.compile(rb'^([A-Z][a-z][a-z], )?\s*(\d{1,2})\s+([A-Z][a-z][a-z])\s+(\d{4})\s+(\d{2}):(\d{2}):(\d{2})\s+([+\-]\d{4})')
+# IMAP dates always use English month names, whatever the locale
+_MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+_MONTHS = {name.encode('ascii'): number for number, name in enumerate(_MONTH_NAMES, 1)}
+
+@functools.lru_cache(maxsize=4096)
+def _internaldate_from_header(date_value: bytes) -> str | None:
+    """Converts a raw Date header value to a quoted IMAP internal date.
+
+    Cached because many messages in an archive share identical timestamps.
+    """
+    try:
+        match = _DATE_RE.search(date_value.strip())
+        if match:
+            _, day, month, year, hour, minute, second, zone = match.groups()
+            if month in _MONTHS and int(zone[1:3]) < 24 and int(zone[3:5]) < 60:
+                # datetime() rejects impossible dates such as 31 Feb, which the server
+                # would answer with BAD (failing a whole MULTIAPPEND batch)
+                dt = datetime.datetime(int(year), _MONTHS[month], int(day),
+                                       int(hour), int(minute), int(second))
+                return '"%02d-%s-%04d %02d:%02d:%02d %s"' % (
+                    dt.day, _MONTH_NAMES[dt.month - 1], dt.year, dt.hour, dt.minute, dt.second,
+                    zone.decode())
+        # Slow path: full RFC 2822 parsing for everything the regex doesn't cover
+        dt = email.utils.parsedate_to_datetime(date_value.decode('ascii', 'replace'))
+        # Keep the header's own UTC offset; a naive result means "-0000" (zone unknown)
+        offset = dt.utcoffset()
+        offset_minutes = int(offset.total_seconds()) // 60 if offset is not None else 0
+        sign = '-' if offset_minutes < 0 else '+'
+        return '"%02d-%s-%04d %02d:%02d:%02d %s%02d%02d"' % (
+            dt.day, _MONTH_NAMES[dt.month - 1], dt.year, dt.hour, dt.minute, dt.second,
+            sign, abs(offset_minutes) // 60, abs(offset_minutes) % 60)
+    except Exception:
+        # Handle invalid or unparseable dates gracefully
+        return None
+
+# A complete, unfolded Date header line; anything unusual is left to the header parser
+_DATE_HEADER_RE = re.compile(rb'^Date:[ \t]*([^\r\n]+?)[ \t]*\r?\n(?![ \t])', re.IGNORECASE | re.MULTILINE)
+
+# The Date header is nearly always within the first 2 KB of the headers; the regex
+# scan stops there instead of walking long Received: chains
+_DATE_SCAN_LIMIT = 2048
+
+# Only ever given header blocks, and told so with headersonly=True; message
+# bodies are never turned into Message objects
+_HEADER_PARSER = email.parser.BytesParser(policy=email.policy.compat32)
+
+def get_message_date(header_bytes: bytes) -> str | None:
+    """Attempts to get the internal date from the message's header block."""
+    match = _DATE_HEADER_RE.search(header_bytes, 0, _DATE_SCAN_LIMIT)
+    if match:
+        internal_date = _internaldate_from_header(match.group(1))
+        if internal_date is not None:
+            return internal_date
+    # Fall back to the header parser, e.g. for a folded or late Date header
+    date_str = _HEADER_PARSER.parsebytes(header_bytes, headersonly=True).get('Date')
     if not date_str:
         return None
+    # A value with 8-bit bytes comes back as an email.header.Header, not a str;
+    # those bytes can't be part of a valid date anyway
+    return _internaldate_from_header(str(date_str).encode('ascii', 'replace'))
+
+# Matches the blank line separating the headers from the body
+_HEADER_END_RE = re.compile(rb'\r?\n\r?\n')
+
+def open_mbox_map(mbox_path: str) -> mmap.mmap:
+    """Memory-maps the MBOX file read-only, hinting the kernel that it is read sequentially."""
+    with open(mbox_path, 'rb') as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        # The mapping stays valid after the file object is closed
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mm, 'madvise'):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return mm
+
+def _message_end(mm: mmap.mmap, start: int, end: int) -> int:
+    """Trims the blank separator line off the end of a message's byte range."""
+    if mm[end - 2:end] == b'\n\n':
+        end -= 1
+    elif mm[end - 3:end] == b'\n\r\n':
+        end -= 2
+    return max(start, end)
+
+# The newline in front of a 'From ' envelope line. The literal prefix lets the regex
+# engine scan for it with its fast C search loop
+_DELIMITER_RE = re.compile(rb'\nFrom ')
+
+def index_mbox(mm: mmap.mmap) -> array.array:
+    """Returns the offsets of the 'From ' lines that start each message in the mapped MBOX file.
+
+    The whole file is scanned in a single pass inside the regex engine, so
+    indexing runs at close to memory speed instead of one Python call per
+    message, and the index takes only 8 bytes per message.
+    """
+    delimiters = array.array('q')
+    if mm[:5] == b'From ':
+        delimiters.append(0)
+    delimiters.extend(match.start() + 1 for match in _DELIMITER_RE.finditer(mm))
+    return delimiters
+
+_MESSAGE_ID_RE = re.compile(rb'^Message-ID:[ \t]*(<[^>\r\n]*>)', re.IGNORECASE | re.MULTILINE)
+
+def order_largest_first(mm: mmap.mmap, delimiters: array.array) -> array.array:
+    """Returns the message numbers (indexes into `delimiters`) sorted by size, largest first.
+
+    Uploading the largest messages first keeps every connection busy until
+    the end: the last batches are small ones that finish together, rather
+    than a few huge messages that leave the other connections idle.
+    """
+    limits = delimiters[1:]
+    limits.append(len(mm))
+    sizes = [limit - from_pos for from_pos, limit in zip(delimiters, limits)]
+    # sorted() is stable, so messages of equal size stay in file order
+    return array.array('q', sorted(range(len(sizes)), key=sizes.__getitem__, reverse=True))
+
+def iter_mbox_raw(mm: mmap.mmap, delimiters: array.array, skip_offsets: set = frozenset(),
+                  order: array.array | None = None):
+    """Yields (offset, message_view, internal_date, message_id) for each message in the mapped MBOX file.
+
+    A message spans from after its 'From ' envelope line to the next one,
+    minus the blank separator line; everything else is kept verbatim. Each
+    message is a memoryview slice of the mapping, so its bytes are never
+    copied into Python objects; socket sends accept the view directly.
+    Messages starting at an offset in `skip_offsets` are left out. Messages
+    are yielded in file order, or in the order of the message numbers in `order`.
+    """
+    view = memoryview(mm)
+    # This loop runs once per message: everything it calls is looked up once,
+    # up front, and the offsets are computed inline rather than in a nested generator
+    find = mm.find
+    message_end = _message_end
+    find_header_end = _HEADER_END_RE.search
+    find_message_id = _MESSAGE_ID_RE.search
+    message_date = get_message_date
+    limits = delimiters[1:]
+    limits.append(len(mm))
+    if order is None:
+        bounds = zip(delimiters, limits)
+    else:
+        bounds = ((delimiters[i], limits[i]) for i in order)
+    for from_pos, limit in bounds:
+        line_end = find(b'\n', from_pos, limit)
+        start = limit if line_end == -1 else line_end + 1
+        if start in skip_offsets:
+            continue
+        end = message_end(mm, start, limit)
+        # Only the header block is parsed; the body is never turned into a Message
+        match = find_header_end(mm, start, end)
+        header_blob = mm[start:match.end() if match else end]
+        id_match = find_message_id(header_blob)
+        message_id = id_match.group(1).decode('ascii', 'replace') if id_match else None
+        yield start, view[start:end], message_date(header_blob), message_id
+
+def _batched(messages, size: int, max_bytes: int):
+    """Yields lists of up to `size` messages, closing a list early once it holds `max_bytes`."""
+    batch = []
+    batch_bytes = 0
+    for message in messages:
+        batch.append(message)
+        batch_bytes += len(message[1])
+        if len(batch) == size or batch_bytes >= max_bytes:
+            yield batch
+            batch = []
+            batch_bytes = 0
+    if batch:
+        yield batch
+
+def get_capabilities(server: imaplib.IMAP4) -> set:
+    """Returns the server capabilities, re-read after login (servers may advertise more then)."""
+    status, data = server.capability()
+    if status == 'OK' and data and data[-1]:
+        return set(data[-1].decode('ascii', 'replace').upper().split())
+    return set(server.capabilities)
+
+def quote_mailbox(name: str) -> str:
+    """Quotes a mailbox name for use in IMAP commands (handles spaces, quotes and backslashes)."""
+    return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+# One LIST response: (flags) "delimiter" name, where the name may be quoted
+_LIST_RESPONSE_RE = re.compile(rb'\((?P<flags>[^)]*)\) (?P<delimiter>NIL|"(?:[^"\\]|\\.)*") (?P<name>.*)')
+
+def mailbox_exists(server: imaplib.IMAP4, quoted_mailbox: str, mailbox: str) -> bool:
+    """Checks with a single LIST command whether the mailbox already exists."""
+    status, data = server.list('""', quoted_mailbox)
+    if status != 'OK':
+        raise imaplib.IMAP4.error(f"Failed to list folders: {data}")
+    for item in data:
+        if isinstance(item, tuple):
+            # The name was sent as a literal
+            name = item[1]
+        else:
+            match = _LIST_RESPONSE_RE.match(item or b'')
+            if not match:
+                continue
+            name = match.group('name')
+            if name.startswith(b'"') and name.endswith(b'"'):
+                name = re.sub(rb'\\(.)', rb'\1', name[1:-1])
+        if name.decode('utf-8', 'replace') == mailbox:
+            return True
+    return False
+
+def message_id_key(message_id: str) -> bytes:
+    """Returns the compact key under which a Message-ID is remembered for duplicate detection."""
+    # 16 bytes per message instead of the full ID keeps the set small for huge folders
+    return hashlib.blake2b(message_id.encode('utf-8'), digest_size=16).digest()
+
+def fetch_message_ids(server: imaplib.IMAP4, quoted_mailbox: str) -> set:
+    """Returns the message_id_key() of every message in the mailbox that has a Message-ID.
+
+    Only the Message-ID header is fetched, DEDUPE_FETCH_BATCH messages per
+    command, so even a large folder takes just a few round-trips. The
+    mailbox is opened read-only, leaving the messages' flags untouched.
+    """
+    status, data = server.select(quoted_mailbox, readonly=True)
+    if status != 'OK':
+        raise imaplib.IMAP4.error(f"Failed to select folder: {data}")
+    status, data = server.uid('SEARCH', 'ALL')
+    if status != 'OK':
+        raise imaplib.IMAP4.error(f"Failed to search folder: {data}")
+    uids = sorted(int(uid) for uid in data[0].split()) if data and data[0] else []
+    known_ids = set()
+    for i in range(0, len(uids), DEDUPE_FETCH_BATCH):
+        chunk = uids[i:i + DEDUPE_FETCH_BATCH]
+        # UIDs are sorted, so one range covers the chunk; gaps in it are simply skipped
+        status, data = server.uid('FETCH', f"{chunk[0]}:{chunk[-1]}",
+                                  '(BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])')
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"Failed to fetch Message-IDs: {data}")
+        for part in data:
+            if isinstance(part, tuple):
+                match = _MESSAGE_ID_RE.search(part[1])
+                if match:
+                    known_ids.add(message_id_key(match.group(1).decode('ascii', 'replace')))
+    return known_ids
+
+# IMAP requires CRLF line endings; MBOX files usually store bare LF
+_LINE_ENDING_RE = re.compile(rb'\r\n|\r|\n')
+_BARE_LINE_ENDING_RE = re.compile(rb'\r(?!\n)|(?<!\r)\n')
+
+def send_appends(server: imaplib.IMAP4, quoted_mailbox: str, batch: list,
+                 multiappend: bool, tags: list):
+    """Writes the APPEND commands for a batch of MBOX messages without reading any response.
+
+    Requires LITERAL+ (RFC 7888): literals are sent as non-synchronizing
+    '{N+}', so there is nothing to wait for. With MULTIAPPEND (RFC 3502) the
+    whole batch goes out as a single APPEND command. The command tags are
+    added to `tags` as the commands are started, to be passed to receive_appends().
+    """
+    send = server.send
+    new_tag = server._new_tag
+    has_bare_line_ending = _BARE_LINE_ENDING_RE.search
+    to_crlf = _LINE_ENDING_RE.sub
+    mailbox_arg = b' APPEND ' + quoted_mailbox.encode('utf-8')
+    pending = b''
+    for _, message_bytes, message_date, _ in batch:
+        if has_bare_line_ending(message_bytes):
+            literal = to_crlf(b'\r\n', message_bytes)
+        else:
+            # Already CRLF: send the mapped bytes without copying them
+            literal = message_bytes
+        if multiappend and tags:
+            command = pending
+        else:
+            tag = new_tag()
+            tags.append(tag)
+            command = pending + tag + mailbox_arg
+        if message_date:
+            command += b' ' + message_date.encode('ascii')
+        send(command + b' {%d+}\r\n' % len(literal))
+        send(literal)
+        pending = b'' if multiappend else b'\r\n'
+    send(b'\r\n')
+
+def receive_appends(server: imaplib.IMAP4, tags: list, count: int, results: list):
+    """Reads the responses to send_appends() into `results`, one (status, data) tuple per message.
+
+    Responses are added one tag at a time, so if the connection fails
+    part-way, `results` still holds the ones that did arrive.
+    """
+    while len(results) < len(tags):
+        results.append(server._get_tagged_response(tags[len(results)]))
+    if len(results) < count:
+        # MULTIAPPEND is atomic: one response covers every message in the batch
+        results *= count
+
+# Flags for uploaded messages (None for now, could attempt to map MBOX flags later if needed)
+_MESSAGE_FLAGS = None
+
+# imaplib only sends commands it knows about
+imaplib.Commands.setdefault('COMPRESS', ('AUTH', 'SELECTED'))
+
+class _DeflateSocket:
+    """Socket wrapper that compresses everything sent over a COMPRESS=DEFLATE connection."""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+
+    def sendall(self, data):
+        # Sync-flush every write so the server can act on each command right away
+        self._sock.sendall(self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+class _InflateReader(io.RawIOBase):
+    """Raw stream that decompresses what is received over a COMPRESS=DEFLATE connection."""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._decompressor = zlib.decompressobj(-15)
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            data = self._sock.recv(65536)
+            if not data:
+                return 0
+            self._pending = self._decompressor.decompress(data)
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        self._pending = self._pending[count:]
+        return count
+
+def enable_compression(server: imaplib.IMAP4) -> bool:
+    """Switches the connection to COMPRESS=DEFLATE (RFC 4978). Returns False if the server refused."""
+    status, data = server._simple_command('COMPRESS', 'DEFLATE')
+    if status != 'OK':
+        return False
+    raw_sock = server.sock
+    server.file.close() # The server sends nothing until our next command, so nothing is lost
+    server.sock = _DeflateSocket(raw_sock)
+    server.file = io.BufferedReader(_InflateReader(raw_sock))
+    return True
+
+def connect_and_login(host: str, port: int, use_ssl: bool, user: str, password: str) -> imaplib.IMAP4:
+    """Opens a new IMAP connection and logs in. Raises IMAP4.error on failure."""
+    if use_ssl:
+        server = imaplib.IMAP4_SSL(host, port)
+    else:
+        server = imaplib.IMAP4(host, port)
     try:
-        # Parse the date string into a datetime object
-        dt = email.utils.parsedate_to_datetime(date_str)
-        # Convert to struct_time (required by Time2Internaldate)
-        tt = dt.timetuple()
-        # Convert to IMAP internal date format
-        return imaplib.Time2Internaldate(time.mktime(tt))
+        status, data = server.login(user, password)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"IMAP login failed: {data}")
     except Exception:
-        # Handle invalid or unparseable dates gracefully
+        close_quietly(server)
+        raise
+    return server
+
+def close_quietly(server: imaplib.IMAP4):
+    """Logs out, ignoring errors (the connection may already be gone)."""
+    try:
+        server.logout()
+    except Exception:
+        pass
+
+class UploadConnection:
+    """An upload worker's IMAP connection, with a window of unanswered APPEND commands.
+
+    On servers with LITERAL+ up to `inflight` messages stay outstanding: later
+    batches are written while the responses to earlier ones are still on their
+    way, so the connection never idles for a round-trip between batches.
+    Other servers get one synchronous APPEND per message.
+    """
+
+    def __init__(self, connection_details: tuple, quoted_mailbox: str, inflight: int):
+        self.server = connect_and_login(*connection_details)
+        self.quoted_mailbox = quoted_mailbox
+        # Synchronous APPEND with the per-connection arguments already bound
+        self._append = functools.partial(self.server.append, quoted_mailbox, _MESSAGE_FLAGS)
+        # Sent (item, tags, results) entries, oldest first: the (batch, attempt)
+        # item, its command tags when pipelined, and the responses read so far
+        self.pending = collections.deque()
+        self.in_flight = 0 # Messages sent but not yet collected with receive()
+        try:
+            capabilities = get_capabilities(self.server)
+            self.pipelined = 'LITERAL+' in capabilities
+            self.multiappend = self.pipelined and 'MULTIAPPEND' in capabilities
+            self.window = inflight if self.pipelined else 1
+            if 'COMPRESS=DEFLATE' in capabilities:
+                enable_compression(self.server)
+            # Some servers append faster to the selected mailbox
+            status, data = self.server.select(quoted_mailbox)
+            if status != 'OK':
+                raise imaplib.IMAP4.error(f"Failed to select folder: {data}")
+        except Exception:
+            close_quietly(self.server)
+            raise
+
+    def send(self, item: tuple):
+        """Starts uploading a (batch, attempt) item."""
+        batch = item[0]
+        # Registered first, so the item is accounted for even if sending fails
+        tags, results = [], []
+        self.pending.append((item, tags, results))
+        self.in_flight += len(batch)
+        if self.pipelined:
+            send_appends(self.server, self.quoted_mailbox, batch, self.multiappend, tags)
+        else:
+            append = self._append
+            for _, message_bytes, message_date, _ in batch:
+                try:
+                    results.append(append(message_date, message_bytes))
+                except imaplib.IMAP4.abort:
+                    raise # The connection itself failed
+                except imaplib.IMAP4.error as e:
+                    # imaplib raises on a tagged BAD; it only concerns this message
+                    results.append(('BAD', [str(e).encode('utf-8', 'replace')]))
+
+    def receive(self) -> tuple:
+        """Waits for the oldest sent item to be answered. Returns (item, results)."""
+        item, tags, results = self.pending[0]
+        if self.pipelined:
+            receive_appends(self.server, tags, len(item[0]), results)
+        self.pending.popleft()
+        self.in_flight -= len(item[0])
+        # The selected mailbox reports EXISTS/RECENT after appends; nothing reads them,
+        # so don't let them pile up in imaplib over a long run. A BYE is kept: it
+        # tells said_bye() why the next command on this connection fails
+        untagged = self.server.untagged_responses
+        bye = untagged.get('BYE')
+        untagged.clear()
+        if bye:
+            untagged['BYE'] = bye
+        return item, results
+
+    def said_bye(self) -> bool:
+        """Tells whether the server closed the connection with an untagged BYE."""
+        # imaplib's abort error only carries the text after "BYE", so look at the response itself
+        return 'BYE' in self.server.untagged_responses
+
+    def drain(self) -> Exception | None:
+        """Reads the responses that arrived before a failed write, e.g. a server that hung up.
+
+        The server may have answered earlier commands, and said why it closed
+        the connection, before the write failed. Returns the error that
+        stopped the reading, which carries the server's BYE text if it sent one.
+        """
+        if not self.pipelined:
+            return None
+        try:
+            for item, tags, results in self.pending:
+                receive_appends(self.server, tags, len(item[0]), results)
+        except Exception as e:
+            return e
         return None
 
+    def take_pending(self) -> list:
+        """Removes every sent item that hasn't been collected with receive().
+
+        Returns (item, results) pairs; `results` holds the responses to the
+        item's first messages that did arrive, possibly none.
+        """
+        items = [(item, results) for item, _, results in self.pending]
+        self.pending.clear()
+        self.in_flight = 0
+        return items
+
+    def close(self):
+        close_quietly(self.server)
+
+def describe_message(message: tuple) -> str:
+    """Names a message the way a user can find it in the MBOX file."""
+    offset, _, _, message_id = message
+    return f"message at byte offset {offset}" + (f" (Message-ID {message_id})" if message_id else "")
+
+def response_text(data: list) -> str:
+    """Joins the text parts of a server response's data."""
+    return ' '.join(part.decode('ascii', 'replace') for part in data if isinstance(part, bytes))
+
+class UploadProgress:
+    """Upload counters shared by the upload workers.
+
+    Progress is shown as a single line that is rewritten in place, and errors
+    are kept for the summary instead of being printed as they happen, so a
+    failing server doesn't slow the upload down with console output.
+    """
+
+    def __init__(self, total_messages: int):
+        self.total_messages = total_messages
+        self.uploaded_count = 0
+        self.error_count = 0
+        self.duplicate_count = 0
+        self.recent_errors = collections.deque(maxlen=MAX_REPORTED_ERRORS)
+        self._line_open = False
+        self._lock = threading.Lock()
+
+    def record(self, batch: list, results: list) -> int:
+        """Records the results of one batch. Returns how many messages were uploaded."""
+        uploaded = [status for status, _ in results].count('OK')
+        with self._lock:
+            before = self.uploaded_count
+            self.uploaded_count += uploaded
+            if uploaded < len(results):
+                self.error_count += len(results) - uploaded
+                self.recent_errors.extend(
+                    f"Error uploading {describe_message(message)}: {status} {response_text(data)}"
+                    for message, (status, data) in zip(batch, results) if status != 'OK')
+            if (self.uploaded_count // PROGRESS_INTERVAL != before // PROGRESS_INTERVAL
+                    or self.uploaded_count + self.error_count == self.total_messages):
+                self._show()
+        return uploaded
+
+    def record_failure(self, batch: list, error: Exception):
+        """Records a batch that could not be uploaded at all."""
+        with self._lock:
+            self.error_count += len(batch)
+            self.recent_errors.extend(f"Critical error uploading {describe_message(message)}: {error}"
+                                      for message in batch)
+            self._show()
+
+    def record_duplicates(self, count: int):
+        """Records messages left out because the target folder already has them."""
+        with self._lock:
+            self.duplicate_count += count
+            self.total_messages -= count
+            if self._line_open and self.uploaded_count + self.error_count == self.total_messages:
+                self._show()
+
+    def _show(self):
+        sys.stdout.flush() # Keep ordering with anything print() has buffered
+        sys.stdout.buffer.write(b'\rUploaded %d/%d messages (%d errors)'
+                                % (self.uploaded_count, self.total_messages, self.error_count))
+        sys.stdout.buffer.flush()
+        self._line_open = True
+
+    def log(self, message: str):
+        """Prints a message without mangling the progress line."""
+        with self._lock:
+            self._end_line()
+            print(message)
+
+    def _end_line(self):
+        if self._line_open:
+            sys.stdout.buffer.write(b'\n')
+            self._line_open = False
+
+    def finish(self):
+        """Ends the progress line and prints the most recent errors."""
+        with self._lock:
+            self._end_line()
+            if self.recent_errors:
+                if self.error_count > len(self.recent_errors):
+                    print(f"Last {len(self.recent_errors)} of {self.error_count} errors:")
+                for error in self.recent_errors:
+                    print(error)
+
+_APPENDUID_RE = re.compile(rb'\[APPENDUID \d+ ([\d:,]+)\]', re.IGNORECASE)
+
+def parse_appenduids(data: list, count: int) -> list:
+    """Returns the `count` UIDs from a UIDPLUS APPENDUID response code, or Nones if unavailable."""
+    match = _APPENDUID_RE.search(data[0]) if data and isinstance(data[0], bytes) else None
+    if match:
+        uids = []
+        for uid_range in match.group(1).split(b','):
+            first, _, last = uid_range.partition(b':')
+            uids.extend(range(int(first), int(last or first) + 1))
+        if len(uids) == count:
+            return uids
+    return [None] * count
+
+class ResumeLog:
+    """Records uploaded messages in "<mbox file>.progress.jsonl" so interrupted uploads can resume.
+
+    The first line identifies the MBOX file by size and modification time,
+    and the destination by server, user and folder; each further line holds
+    the offset, Message-ID and (with UIDPLUS) the server UID of one uploaded
+    message. If the log can't be written the upload goes ahead without it.
+    """
+
+    def __init__(self, mbox_path: str, host: str, user: str, mailbox: str):
+        self.path = mbox_path + ".progress.jsonl"
+        stat = os.stat(mbox_path)
+        self._header = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                        "host": host, "user": user, "mailbox": mailbox}
+        self._file = None
+        self._unsynced = 0
+        self._lock = threading.Lock()
+
+    def load(self) -> set:
+        """Returns the offsets uploaded by a previous run of the same, unchanged MBOX file to the same folder."""
+        offsets = set()
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                if json.loads(f.readline() or 'null') != self._header:
+                    return offsets
+                for line in f:
+                    try:
+                        offsets.add(json.loads(line)["offset"])
+                    except (ValueError, KeyError, TypeError):
+                        pass # A line cut short by an interrupted run, or otherwise damaged
+        except (OSError, ValueError):
+            pass # Missing, unreadable or not a progress file: start over
+        return offsets
+
+    def open(self, resume: bool):
+        """Opens the log for writing, keeping the previous entries when resuming.
+
+        Raises OSError if the log can't be written; nothing is recorded then.
+        """
+        try:
+            self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+            if resume:
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        # Terminate a line cut short by an interrupted run
+                        self._file.write("\n")
+            else:
+                self._file.write(json.dumps(self._header) + "\n")
+                self.sync()
+        except OSError:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            raise
+
+    def record(self, batch: list, results: list, uids: list):
+        """Appends an entry for every successfully uploaded message of a batch."""
+        with self._lock:
+            if self._file is None:
+                return # The log couldn't be opened
+            for (offset, _, _, message_id), (status, _), uid in zip(batch, results, uids):
+                if status == 'OK':
+                    self._file.write(json.dumps({"offset": offset, "msgid": message_id, "uid": uid}) + "\n")
+                    self._unsynced += 1
+            if self._unsynced >= RESUME_FSYNC_INTERVAL:
+                self.sync()
+
+    def sync(self):
+        """Forces the recorded entries to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        if self._file is not None:
+            with self._lock:
+                self.sync()
+                self._file.close()
+                self._file = None
+
+class TokenBucket:
+    """Rate limiter shared by the upload workers that adapts to the server's throttling."""
+
+    # The rate never drops below this, so a run of throttling can't stall the upload completely
+    MIN_RATE = 0.5
+
+    def __init__(self, rate: float, max_rate: float, burst: int):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._success_run = 0
+        self._lock = threading.Lock()
+
+    def consume(self, count: int = 1):
+        """Takes `count` tokens, sleeping until the rate allows sending that many messages."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            # Going into debt lets batches larger than the burst through at the average rate
+            self._tokens -= count
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    def record_success(self, count: int):
+        """Gently raises the rate after every RATE_INCREASE_INTERVAL successful uploads."""
+        with self._lock:
+            self._success_run += count
+            if self._success_run >= RATE_INCREASE_INTERVAL:
+                self._success_run = 0
+                self.rate = min(self.max_rate, self.rate * 1.1)
+
+    def throttle(self):
+        """Halves the rate after the server signalled that it is overloaded."""
+        with self._lock:
+            self._success_run = 0
+            self.rate = max(self.MIN_RATE, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+
+# Server responses that mean "slow down" rather than "this message is bad". Only the
+# bracketed response codes count: a bare "limit" also appears in permanent rejections
+# such as "[TOOBIG] Message exceeds size limit". A BYE is recognised separately
+# (UploadConnection.said_bye()), since imaplib drops the word from its error text
+_THROTTLE_RE = re.compile(r'\[(?:LIMIT|UNAVAILABLE)\]|TRY AGAIN|THROTTL', re.IGNORECASE)
+
+def is_throttling(response) -> bool:
+    """Tells whether a response's data (a list of bytes) or an error's text asks us to slow down."""
+    if isinstance(response, list):
+        response = response_text(response)
+    return _THROTTLE_RE.search(response) is not None
+
+def record_results(item: tuple, results: list, multiappend: bool, progress: UploadProgress,
+                   bucket: TokenBucket, resume_log: ResumeLog) -> list:
+    """Books the server's answers for one uploaded (batch, attempt) item.
+
+    Returns the messages the server turned away because it was throttling, as
+    long as they may still be retried; they are left out of the counts.
+    """
+    batch, attempt = item
+    if multiappend:
+        uids = parse_appenduids(results[0][1], len(results))
+    else:
+        uids = [parse_appenduids(data, 1)[0] for _, data in results]
+    retry = []
+    throttled = [status != 'OK' and is_throttling(data) for status, data in results]
+    if any(throttled):
+        bucket.throttle()
+        if attempt < MAX_RETRIES:
+            retry = [message for message, again in zip(batch, throttled) if again]
+            kept = [i for i, again in enumerate(throttled) if not again]
+            batch = [batch[i] for i in kept]
+            results = [results[i] for i in kept]
+            uids = [uids[i] for i in kept]
+    uploaded = progress.record(batch, results)
+    resume_log.record(batch, results, uids)
+    bucket.record_success(uploaded)
+    return retry
+
+def rejected_as_a_whole(item: tuple, results: list, multiappend: bool) -> bool:
+    """Tells whether a MULTIAPPEND batch failed for a reason other than throttling.
+
+    MULTIAPPEND is atomic (RFC 3502): one bad message fails every message in
+    the command, so such a batch is sent again one message at a time to find
+    the bad one.
+    """
+    return (multiappend and len(item[0]) > 1 and results[0][0] != 'OK'
+            and not is_throttling(results[0][1]))
+
+def _back_off(worker_num: int, progress: UploadProgress, reason: str, attempt: int):
+    """Waits before retrying after the server signalled throttling; the wait doubles with every attempt."""
+    delay = RETRY_BASE_DELAY_SECONDS * 2 ** attempt
+    progress.log(f"Worker {worker_num}: server is throttling ({reason}), retrying in {delay:.0f}s...")
+    time.sleep(delay)
+
+def upload_worker(worker_num: int, connection_details: tuple, quoted_mailbox: str,
+                  work_queue: queue.Queue, progress: UploadProgress, bucket: TokenBucket,
+                  resume_log: ResumeLog, inflight: int):
+    """Uploads batches from `work_queue` over this worker's own IMAP connection.
+
+    Each worker owns its connection, since imaplib objects are not thread-safe.
+    A None item on the queue tells the worker to stop once everything it sent
+    has been answered. Messages the server turns away because it is throttling
+    are sent again after a pause. When the connection fails, every batch still
+    awaiting an answer is retried on a new connection if the server was
+    throttling, and counted as failed otherwise.
+    """
+    connection = None
+    retries = collections.deque() # (batch, attempt) items to send again
+    connect_attempt = 0
+    stopping = False
+    try:
+        while True:
+            try:
+                if connection is None:
+                    connection = UploadConnection(connection_details, quoted_mailbox, inflight)
+                    connect_attempt = 0
+                # Collect answers once the window is full, or when nothing is left to send
+                if connection.pending and (connection.in_flight >= connection.window
+                                           or (stopping and not retries)):
+                    item = None
+                elif retries:
+                    item = retries.popleft()
+                elif stopping:
+                    return
+                else:
+                    try:
+                        # Don't sit waiting for new work while answers are outstanding
+                        queued = work_queue.get(block=not connection.pending)
+                    except queue.Empty:
+                        item = None
+                    else:
+                        if queued is None:
+                            stopping = True
+                            continue
+                        item = (queued, 0)
+                if item is None:
+                    sent, results = connection.receive()
+                    if rejected_as_a_whole(sent, results, connection.multiappend):
+                        retries.extend(([message], sent[1]) for message in sent[0])
+                        continue
+                    retry = record_results(sent, results, connection.multiappend, progress, bucket,
+                                           resume_log)
+                    if retry:
+                        retries.append((retry, sent[1] + 1))
+                        reason = next(response_text(data) for status, data in results if status != 'OK')
+                        _back_off(worker_num, progress, reason, sent[1])
+                    continue
+                bucket.consume(len(item[0]))
+                connection.send(item)
+            except Exception as e:
+                if isinstance(e, OSError) and connection is not None:
+                    # A failed write hides whatever the server answered before hanging up
+                    e = connection.drain() or e
+                # A server that hangs up mid-run (e.g. "* BYE Too many connections")
+                # is slowing us down, whatever its reason text says
+                throttled = is_throttling(str(e)) or (connection is not None and connection.said_bye())
+                if connection is None:
+                    # Could not connect at all
+                    connect_attempt += 1
+                    if not throttled or connect_attempt > MAX_RETRIES:
+                        progress.log(f"Worker {worker_num}: could not connect to the IMAP server: {e}")
+                        for batch, _ in retries:
+                            progress.record_failure(batch, e)
+                        retries.clear()
+                        return
+                    attempt = connect_attempt - 1
+                else:
+                    # Whatever was in flight shares the fate of the connection
+                    attempt = 0
+                    for (batch, batch_attempt), answered in connection.take_pending():
+                        if answered and rejected_as_a_whole((batch, batch_attempt), answered,
+                                                            connection.multiappend):
+                            retries.extend(([message], batch_attempt) for message in batch)
+                            continue
+                        if answered:
+                            # These got their answer before the connection failed
+                            retry = record_results((batch[:len(answered)], batch_attempt), answered,
+                                                   connection.multiappend, progress, bucket, resume_log)
+                            if retry:
+                                retries.append((retry, batch_attempt + 1))
+                            batch = batch[len(answered):]
+                            if not batch:
+                                continue
+                        if throttled and batch_attempt < MAX_RETRIES:
+                            retries.append((batch, batch_attempt + 1))
+                            attempt = max(attempt, batch_attempt)
+                        else:
+                            progress.record_failure(batch, e)
+                    connection.close()
+                    connection = None
+                if throttled:
+                    bucket.throttle()
+                    _back_off(worker_num, progress, str(e), attempt)
+    finally:
+        if connection is not None:
+            connection.close()
+
+def _put_batch(work_queue: queue.Queue, item: tuple, futures: list):
+    """Queues a batch, failing instead of blocking forever if every worker has stopped."""
+    while True:
+        try:
+            work_queue.put(item, timeout=1)
+            return
+        except queue.Full:
+            if all(future.done() for future in futures):
+                raise RuntimeError("All upload workers stopped unexpectedly.") from None
+
+def _new_messages(messages, known_ids: set, progress: UploadProgress):
+    """Yields the messages whose Message-ID isn't in `known_ids`, counting the others as duplicates."""
+    duplicates = 0
+    for message in messages:
+        message_id = message[3]
+        if message_id is not None and message_id_key(message_id) in known_ids:
+            duplicates += 1
+            continue
+        if duplicates:
+            progress.record_duplicates(duplicates)
+            duplicates = 0
+        yield message
+    if duplicates:
+        progress.record_duplicates(duplicates)
+
+def produce_batches(mm: mmap.mmap, delimiters: array.array, order: array.array | None,
+                    skip_offsets: set, known_ids: set, batch_size: int, work_queue: queue.Queue,
+                    futures: list, progress: UploadProgress):
+    """Feeds batches of messages from the mapped MBOX file to the workers, in the given order.
+
+    Messages whose Message-ID is in `known_ids` are already on the server and are left out.
+    """
+    # Messages are mapped, not read, so memory use stays flat for large MBOX files
+    messages = iter_mbox_raw(mm, delimiters, skip_offsets, order)
+    if known_ids:
+        messages = _new_messages(messages, known_ids, progress)
+    for batch in _batched(messages, batch_size, APPEND_BATCH_BYTES):
+        _put_batch(work_queue, batch, futures)
+
 def main():
     """Main function to perform the MBOX to IMAP upload."""
+    args = parse_args()
+
     # --- Get MBOX Path ---
     mbox_path_input = input(f"Enter path to MBOX file [{DEFAULT_MBOX_PATH}]: ") or DEFAULT_MBOX_PATH
     mbox_path = os.path.abspath(mbox_path_input)
@@ -86,6 +1045,9 @@ def main():
     if not os.path.isfile(mbox_path):
         print(f"Error: MBOX file not found at '{mbox_path}'")
         sys.exit(1)
+    if os.path.getsize(mbox_path) == 0:
+        print(f"Error: MBOX file '{mbox_path}' is empty.")
+        sys.exit(1)
 
     # --- Get IMAP Details ---
     imap_host, imap_port, use_ssl, imap_user, imap_password, target_mailbox = get_imap_details()
@@ -102,6 +1064,8 @@ def main():
     print("Connecting to IMAP server...")
 
     server = None
+    mbox_map = None
+    resume_log = None
     total_messages = 0
     uploaded_count = 0
     error_count = 0
@@ -128,69 +1092,105 @@ def main():
             sys.exit(1)
 
         # --- Prepare Target Mailbox ---
+        # Quoted once and reused for every command (handles names with spaces/special chars)
+        quoted_mailbox = quote_mailbox(target_mailbox)
         print(f"Checking/Creating target folder '{target_mailbox}'...")
         try:
-            # Try creating the mailbox. Ignore error if it already exists.
-            status, data = server.create(f'"{target_mailbox}"') # Use quotes for names with spaces/special chars
-            if status == 'OK':
-                print(f"Folder '{target_mailbox}' created.")
-            elif "exists" in str(data[0]).lower():
-                 print(f"Folder '{target_mailbox}' already exists.")
+            # Look the folder up first so CREATE is only sent when it is really missing
+            mailbox_existed = mailbox_exists(server, quoted_mailbox, target_mailbox)
+            if mailbox_existed:
+                print(f"Folder '{target_mailbox}' already exists.")
             else:
-                # Raise unexpected errors during creation
-                raise imaplib.IMAP4.error(f"Failed to create/verify folder: {data}")
+                status, data = server.create(quoted_mailbox)
+                if status != 'OK':
+                    raise imaplib.IMAP4.error(f"Failed to create folder: {data}")
+                print(f"Folder '{target_mailbox}' created.")
         except imaplib.IMAP4.error as e:
-            # Ignore "already exists" errors, raise others
-            if "exists" not in str(e).lower():
-                print(f"Error creating/selecting mailbox '{target_mailbox}': {e}")
-                sys.exit(1)
-            else:
-                 print(f"Folder '{target_mailbox}' already exists (error ignored).")
-
+            print(f"Error creating/selecting mailbox '{target_mailbox}': {e}")
+            sys.exit(1)
 
         # --- Open and Process MBOX ---
         print(f"Opening MBOX file: {mbox_path}")
-        mbox = mailbox.mbox(mbox_path)
-        print("Reading messages and starting upload...")
+        mbox_map = open_mbox_map(mbox_path)
+        delimiters = index_mbox(mbox_map)
+        total_messages = len(delimiters)
+        print(f"Found {total_messages} messages in the MBOX file.")
 
-        message_list = list(mbox) # Read all messages into memory (may use significant RAM for large MBOX)
-        total_messages = len(message_list)
-        print(f"Found {total_messages} messages to upload.")
+        resume_log = ResumeLog(mbox_path, imap_host, imap_user, target_mailbox)
+        done_offsets = set() if args.restart else resume_log.load()
+        if done_offsets:
+            print(f"Resuming: {len(done_offsets)} messages were already uploaded by a previous run "
+                  f"and will be skipped (use --restart to upload everything again).")
+        try:
+            resume_log.open(resume=bool(done_offsets))
+        except OSError as e:
+            print(f"Warning: cannot write the progress file '{resume_log.path}' ({e}). "
+                  f"Uploading anyway, but an interrupted upload will start over.")
+        skipped_count = len(done_offsets)
 
-        for i, msg in enumerate(message_list):
-            current_msg_num = i + 1
-            try:
-                # Get message data as bytes
-                message_bytes = msg.as_bytes()
-                # Try to get the internal date
-                message_date = get_message_date(msg)
-                # Flags (start with None, could attempt to map MBOX flags later if needed)
-                message_flags = None
-
-                # Append the message
-                status, data = server.append(f'"{target_mailbox}"',
-                                             message_flags,
-                                             message_date,
-                                             message_bytes)
+        known_ids = set()
+        if mailbox_existed and not args.no_dedupe:
+            print(f"Reading the Message-IDs of the messages already in '{target_mailbox}'...")
+            known_ids = fetch_message_ids(server, quoted_mailbox)
+            if known_ids:
+                print(f"Messages with one of these {len(known_ids)} Message-IDs will be skipped "
+                      f"(use --no-dedupe to upload them anyway).")
+        print(f"{total_messages - skipped_count} messages to upload.")
+        order = None
+        if not args.in_order:
+            # Workers take batches off a shared queue, so feeding it largest-first
+            # is all the scheduling needed
+            order = order_largest_first(mbox_map, delimiters)
+            if hasattr(mbox_map, 'madvise'):
+                # The file is no longer read front to back; plain readahead suits that better
+                mbox_map.madvise(mmap.MADV_NORMAL)
+        print("Streaming messages and starting upload...")
 
-                if status == 'OK':
-                    uploaded_count += 1
-                    if uploaded_count % PROGRESS_INTERVAL == 0 or current_msg_num == total_messages:
-                        print(f"Uploaded message {uploaded_count}/{total_messages}")
-                else:
-                    error_count += 1
-                    print(f"Error uploading message {current_msg_num}/{total_messages}: {data}")
+        capabilities = get_capabilities(server)
+        pipelined = 'LITERAL+' in capabilities
+        if pipelined and 'MULTIAPPEND' in capabilities:
+            print("Server supports LITERAL+ and MULTIAPPEND: sending messages in batched APPEND commands.")
+        elif pipelined:
+            print("Server supports LITERAL+: pipelining APPEND commands.")
+        batch_size = APPEND_BATCH_SIZE if pipelined else 1
 
-                # Add a small delay
-                time.sleep(UPLOAD_DELAY_SECONDS)
+        # The workers open their own connections; free this one so it doesn't count
+        # against the provider's connection limit during the upload
+        close_quietly(server)
+        server = None
 
-            except Exception as e:
-                error_count += 1
-                print(f"Critical error processing/uploading message {current_msg_num}/{total_messages}: {e}")
-                # print(traceback.format_exc()) # Uncomment for full error details
+        print(f"Uploading with {args.workers} parallel connection(s)...")
+        progress = UploadProgress(total_messages - skipped_count)
+        connection_details = (imap_host, imap_port, use_ssl, imap_user, imap_password)
+        work_queue = queue.Queue(maxsize=2 * args.workers)
+        bucket = TokenBucket(args.initial_rate, args.max_rate, args.burst)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+                futures = [executor.submit(upload_worker, worker_num, connection_details,
+                                           quoted_mailbox, work_queue, progress, bucket, resume_log,
+                                           args.inflight)
+                           for worker_num in range(1, args.workers + 1)]
+                try:
+                    produce_batches(mbox_map, delimiters, order, done_offsets, known_ids,
+                                    batch_size, work_queue, futures, progress)
+                finally:
+                    for future in futures:
+                        if not future.done():
+                            _put_batch(work_queue, None, futures)
+                for future in futures:
+                    future.result()
+        finally:
+            progress.finish()
+
+        uploaded_count = progress.uploaded_count
+        error_count = progress.error_count
 
         print("\n--- Upload Summary ---")
         print(f"Total messages in MBOX: {total_messages}")
+        if skipped_count:
+            print(f"Skipped (already uploaded): {skipped_count}")
+        if progress.duplicate_count:
+            print(f"Skipped (duplicate Message-ID): {progress.duplicate_count}")
         print(f"Successfully uploaded:   {uploaded_count}")
         print(f"Errors encountered:     {error_count}")
 
@@ -206,6 +1206,13 @@ def main():
         print(traceback.format_exc())
 
     finally:
+        if resume_log is not None:
+            resume_log.close()
+        if mbox_map is not None:
+            try:
+                mbox_map.close()
+            except BufferError:
+                pass # A message view is still referenced; the mapping is released along with it
         # --- Logout and Close Connection ---
         if server:
             try: